@@ -0,0 +1,215 @@
+"""
+Indexed Patient Cohort Registry
+
+Bertopic_over40_patientsID_aug23.xlsx is the only record of the 168,529
+patients in the manuscript cohort, and parsing it with openpyxl takes tens of
+seconds. This script converts it once to a sorted int64 ID array (.npy) and
+keeps it, together with any newly defined cohorts, in a small registry
+directory (results/cohorts/<name>.npy).
+
+Cohorts are loaded memory-mapped (no copy, no parsing), membership is tested
+by binary search (O(log n) per ID, vectorised with np.searchsorted), and
+the membership mask is built from the data's int64 ID column instead of an
+object-dtype pandas isin(). filter_cohort() then makes a shallow row copy of
+the data; callers that must avoid it can index with cohort_mask() directly.
+
+Requirements:
+    pip install pandas numpy openpyxl
+
+Usage:
+    python scripts/cohort_registry.py
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import List, Sequence
+import warnings
+warnings.filterwarnings('ignore')
+
+from ctfidf_reweight import load_config, load_data
+
+
+MANUSCRIPT_COHORT = 'manuscript_over40'
+
+
+def cohort_path(registry_dir: str, name: str) -> Path:
+    """File backing a named cohort"""
+    return Path(registry_dir) / f"{name}.npy"
+
+
+def to_id_array(ids: Sequence) -> np.ndarray:
+    """
+    Convert patient IDs to a sorted, de-duplicated int64 array
+
+    Args:
+        ids: Patient IDs (ints, or floats/strings holding whole numbers)
+
+    Returns:
+        Sorted unique int64 array
+    """
+    values = pd.to_numeric(pd.Series(ids), errors='raise').to_numpy(dtype=np.float64)
+    if np.isnan(values).any() or not np.all(values == np.floor(values)):
+        raise ValueError("Patient IDs must be whole numbers")
+    return np.unique(values.astype(np.int64))
+
+
+def save_cohort(registry_dir: str, name: str, ids: Sequence) -> np.ndarray:
+    """
+    Persist a named cohort as a sorted int64 ID array
+
+    Args:
+        registry_dir: Registry directory
+        name: Cohort name (used as the file name)
+        ids: Patient IDs in the cohort
+
+    Returns:
+        The stored sorted ID array
+    """
+    id_array = to_id_array(ids)
+    path = cohort_path(registry_dir, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, id_array)
+    print(f"Saved cohort '{name}' ({len(id_array)} patients) to: {path}")
+    return id_array
+
+
+def load_cohort(registry_dir: str, name: str) -> np.ndarray:
+    """Load a named cohort as a read-only memory-mapped sorted ID array"""
+    path = cohort_path(registry_dir, name)
+    if not path.exists():
+        raise FileNotFoundError(f"Cohort '{name}' not found at {path}")
+    return np.load(path, mmap_mode='r')
+
+
+def list_cohorts(registry_dir: str) -> List[str]:
+    """Names of all cohorts in the registry"""
+    return sorted(p.stem for p in Path(registry_dir).glob("*.npy"))
+
+
+def import_patients_workbook(
+    excel_path: str,
+    registry_dir: str,
+    name: str = MANUSCRIPT_COHORT,
+    id_column: str = 'ID'
+) -> np.ndarray:
+    """
+    Convert a patients-ID Excel workbook into a registry cohort (one-off)
+
+    Args:
+        excel_path: Path to the workbook (e.g. Bertopic_over40_patientsID_aug23.xlsx)
+        registry_dir: Registry directory
+        name: Cohort name to store it under
+        id_column: Column holding the patient IDs
+
+    Returns:
+        The stored sorted ID array
+    """
+    print(f"Loading patient IDs from: {excel_path}")
+    ids = pd.read_excel(excel_path, usecols=[id_column])[id_column]
+    return save_cohort(registry_dir, name, ids)
+
+
+def contains(cohort_ids: np.ndarray, ids: Sequence) -> np.ndarray:
+    """
+    Vectorised membership test by binary search
+
+    Args:
+        cohort_ids: Sorted int64 cohort array (from load_cohort)
+        ids: Patient IDs to test
+
+    Returns:
+        Boolean array, True where the ID is in the cohort
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(cohort_ids) == 0:
+        return np.zeros(ids.shape, dtype=bool)
+    pos = np.searchsorted(cohort_ids, ids)
+    pos = np.minimum(pos, len(cohort_ids) - 1)
+    return cohort_ids[pos] == ids
+
+
+def cohort_mask(data: pd.DataFrame, cohort_ids: np.ndarray, id_column: str = 'ID') -> np.ndarray:
+    """Boolean row mask selecting the cohort's patients from the sequence data"""
+    return contains(cohort_ids, data[id_column].to_numpy(dtype=np.int64))
+
+
+def filter_cohort(data: pd.DataFrame, cohort_ids: np.ndarray, id_column: str = 'ID') -> pd.DataFrame:
+    """
+    Restrict the sequence data to a cohort
+
+    This is a shallow row copy: every column array (numeric columns and the
+    d2 / AGE2 object pointer arrays) is re-materialised for the selected rows,
+    while the list objects themselves are shared with the original DataFrame.
+    To avoid the copy, use cohort_mask() or np.flatnonzero(cohort_mask(...))
+    and index only the columns that are needed.
+    """
+    return data[cohort_mask(data, cohort_ids, id_column)]
+
+
+def define_cohort(
+    registry_dir: str,
+    name: str,
+    data: pd.DataFrame,
+    mask: Sequence[bool],
+    id_column: str = 'ID'
+) -> np.ndarray:
+    """
+    Define and persist a new cohort from a row mask over the sequence data
+
+    Example:
+        define_cohort(registry, 'female_over65', data,
+                      (data['SEX'] == 2) & (data['AGE_y'] >= 65))
+    """
+    return save_cohort(registry_dir, name, data.loc[np.asarray(mask, dtype=bool), id_column])
+
+
+def main():
+    """Import the manuscript cohort once and report its composition"""
+
+    # Set paths relative to GIT directory
+    base_dir = Path(__file__).parent.parent
+
+    config = load_config(str(base_dir / "config" / "config.yaml"))
+    data_path = base_dir / config['data']['data_file']
+    patients_excel = base_dir / "1. Bertopic_over40" / "Shared_BERtopic_over40" / "Bertopic_over40_patientsID_aug23.xlsx"
+
+    # Registry directory
+    registry_dir = base_dir / "results" / "cohorts"
+
+    print("\n" + "="*60)
+    print("Cohort Registry")
+    print("="*60 + "\n")
+
+    if not cohort_path(str(registry_dir), MANUSCRIPT_COHORT).exists():
+        import_patients_workbook(str(patients_excel), str(registry_dir))
+
+    print(f"Registered cohorts: {', '.join(list_cohorts(str(registry_dir)))}")
+
+    cohort_ids = load_cohort(str(registry_dir), MANUSCRIPT_COHORT)
+    print(f"Manuscript cohort: {len(cohort_ids)} patients")
+
+    if not data_path.exists():
+        print(f"Warning: data file not found at {data_path}")
+        return
+
+    data = load_data(str(data_path))
+    cohort_data = filter_cohort(data, cohort_ids)
+
+    print(f"\nPatients in data: {len(data)}")
+    print(f"Patients in cohort: {len(cohort_data)}")
+    if 'SEX' in cohort_data.columns:
+        print(f"Female patients: {(cohort_data['SEX'] == 2).sum()}")
+        print(f"Male patients: {(cohort_data['SEX'] == 1).sum()}")
+
+    missing = len(cohort_ids) - len(cohort_data)
+    if missing:
+        print(f"Warning: {missing} cohort IDs are not present in the data file")
+
+    print("\n" + "="*60)
+    print("Cohort Registry Complete!")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Cached Document Co-occurrence Statistics and Coherence
+
+Builds the disease-code document frequencies and code x code co-document
+frequencies of a corpus once (103 x 103 for this dataset), then scores any
+number of topic word lists against them without rescanning the documents.
+
+Coherence follows gensim's definitions of C_v, C_uci and C_npmi (one-set /
+one-one segmentation, epsilon = 1e-12), but probabilities are estimated from
+boolean document co-occurrence rather than sliding windows. C_v is unaffected
+for these short documents (gensim's C_v window of 110 tokens spans a whole
+patient record), but gensim scores C_uci and C_npmi over a 10-token window,
+so the document-level values are roughly an order of magnitude larger. They
+are therefore reported as c_uci_doc and c_npmi_doc and cannot be compared
+with the c_uci / c_npmi columns written by evaluate_from_excel.py; use them
+only to compare settings (topic counts, strata, subsamples) with each other.
+
+It also holds the small helpers shared by the analysis scripts (code
+vocabulary, topic word lists, stratum indices), so they can be imported
+without pulling in gensim or yaml.
+
+Requirements:
+    pip install pandas numpy scipy
+"""
+
+import itertools
+import pandas as pd
+import numpy as np
+from scipy import sparse
+from typing import List, Dict, Sequence, Tuple
+
+
+EPSILON = 1e-12
+
+# Visit separator used in the d2 sequences (excluded from topic documents)
+SEP_TOKEN = 'SEP'
+
+
+def code_vocabulary(sequences: Sequence[Sequence[str]]) -> np.ndarray:
+    """Sorted array of all disease codes (every token except 'SEP')"""
+    codes = set(itertools.chain.from_iterable(sequences))
+    codes.discard(SEP_TOKEN)
+    return np.array(sorted(str(code) for code in codes))
+
+
+def topics_from_table(table: pd.DataFrame) -> List[List[str]]:
+    """Topic word lists from a CTFIDF table, excluding the outlier topic"""
+    return [
+        group['Word'].astype(str).tolist()
+        for topic_id, group in table.groupby('Topic', sort=True)
+        if topic_id != -1
+    ]
+
+
+def assign_strata(
+    data: pd.DataFrame,
+    columns: Sequence[str]
+) -> Tuple[np.ndarray, pd.DataFrame]:
+    """
+    Map every row to a stratum index
+
+    Missing values (e.g. no region, or an age outside the configured bands)
+    are kept as a key of their own, so every row belongs to a stratum and
+    coarser roll-ups still cover all rows.
+
+    Args:
+        data: DataFrame holding the stratifying columns
+        columns: Columns whose value combinations define the strata
+
+    Returns:
+        Tuple of (stratum index per row; stratum labels, one row per stratum,
+        with NaN for a missing key)
+    """
+    grouped = data.groupby(list(columns), observed=True, sort=True, dropna=False)
+    labels = grouped.size().index.to_frame(index=False)
+    index = grouped.ngroup().to_numpy(dtype=np.int64)
+    return index, labels
+
+
+def build_incidence(
+    documents: Sequence[str],
+    vocabulary: Sequence[str]
+) -> sparse.csr_matrix:
+    """
+    Build a binary document x term incidence matrix
+
+    Tokens that are not in the vocabulary are ignored.
+
+    Args:
+        documents: Space-separated documents
+        vocabulary: Sorted array of terms defining the matrix columns
+
+    Returns:
+        Sparse (n_documents x n_terms) matrix with 1 where a term occurs
+    """
+    vocabulary = np.asarray(vocabulary, dtype=str)
+    tokenized = [doc.split() for doc in documents]
+    lengths = np.fromiter((len(t) for t in tokenized), dtype=np.int64, count=len(tokenized))
+    flat_tokens = np.array(list(itertools.chain.from_iterable(tokenized)), dtype=str)
+    doc_idx = np.repeat(np.arange(len(tokenized)), lengths)
+
+    term_idx = np.searchsorted(vocabulary, flat_tokens)
+    term_idx = np.minimum(term_idx, len(vocabulary) - 1)
+    known = vocabulary[term_idx] == flat_tokens
+
+    incidence = sparse.csr_matrix(
+        (np.ones(known.sum(), dtype=np.float32), (doc_idx[known], term_idx[known])),
+        shape=(len(tokenized), len(vocabulary))
+    )
+    # Collapse repeated codes within a document to presence/absence
+    incidence.data[:] = 1.0
+    return incidence
+
+
+def cooccurrence_counts(incidence: sparse.spmatrix) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Compute document frequencies and co-document frequencies
+
+    Args:
+        incidence: Binary document x term matrix from build_incidence()
+
+    Returns:
+        Tuple of (doc_freq [n_terms], co_doc_freq [n_terms x n_terms], n_docs)
+    """
+    incidence = sparse.csr_matrix(incidence, dtype=np.float64)
+    co_doc_freq = np.asarray((incidence.T @ incidence).todense())
+    doc_freq = np.diag(co_doc_freq).copy()
+    return doc_freq, co_doc_freq, incidence.shape[0]
+
+
+def save_cooccurrence(
+    output_path: str,
+    doc_freq: np.ndarray,
+    co_doc_freq: np.ndarray,
+    n_docs: int,
+    vocabulary: Sequence[str]
+) -> None:
+    """Persist co-occurrence statistics as a compressed .npz file"""
+    np.savez_compressed(
+        output_path,
+        doc_freq=doc_freq,
+        co_doc_freq=co_doc_freq,
+        n_docs=np.asarray(n_docs),
+        vocabulary=np.asarray(vocabulary, dtype=str)
+    )
+    print(f"Saved co-occurrence statistics to: {output_path}")
+
+
+def load_cooccurrence(input_path: str) -> Tuple[np.ndarray, np.ndarray, int, np.ndarray]:
+    """Load statistics saved by save_cooccurrence()"""
+    print(f"Loading co-occurrence statistics from: {input_path}")
+    with np.load(input_path) as cache:
+        return (cache['doc_freq'], cache['co_doc_freq'],
+                int(cache['n_docs']), cache['vocabulary'])
+
+
+def _pmi_matrices(
+    idx: np.ndarray,
+    doc_freq: np.ndarray,
+    co_doc_freq: np.ndarray,
+    n_docs: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """PMI and NPMI between every pair of the given term indices"""
+    p_w = doc_freq[idx] / n_docs
+    p_ww = co_doc_freq[np.ix_(idx, idx)] / n_docs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pmi = np.log((p_ww + EPSILON) / np.outer(p_w, p_w))
+        npmi = pmi / -np.log(p_ww + EPSILON)
+    return (np.nan_to_num(pmi, nan=0.0, posinf=0.0, neginf=0.0),
+            np.nan_to_num(npmi, nan=0.0, posinf=0.0, neginf=0.0))
+
+
+def coherence_from_cooccurrence(
+    topics: List[List[str]],
+    vocabulary: Sequence[str],
+    doc_freq: np.ndarray,
+    co_doc_freq: np.ndarray,
+    n_docs: int
+) -> Dict[str, float]:
+    """
+    Calculate C_v and document-level C_uci / C_npmi from cached statistics
+
+    Args:
+        topics: List of topic word lists
+        vocabulary: Terms indexing doc_freq / co_doc_freq
+        doc_freq: Number of documents containing each term
+        co_doc_freq: Number of documents containing each pair of terms
+        n_docs: Number of documents in the corpus
+
+    Returns:
+        Dictionary with coherence scores (c_v, c_uci_doc, c_npmi_doc)
+    """
+    if not topics or n_docs == 0:
+        return {'c_v': 0.0, 'c_uci_doc': 0.0, 'c_npmi_doc': 0.0}
+
+    term_index = {str(term): i for i, term in enumerate(vocabulary)}
+    c_v, c_uci, c_npmi = [], [], []
+
+    for words in topics:
+        idx = np.array([term_index[str(w)] for w in words if str(w) in term_index], dtype=np.int64)
+        if len(idx) < 2:
+            continue
+
+        pmi, npmi = _pmi_matrices(idx, doc_freq, co_doc_freq, n_docs)
+
+        # One-one segmentation: all ordered pairs of distinct words
+        off_diag = ~np.eye(len(idx), dtype=bool)
+        c_uci.append(pmi[off_diag].mean())
+        c_npmi.append(npmi[off_diag].mean())
+
+        # One-set segmentation with indirect cosine over NPMI context vectors
+        topic_vector = npmi.sum(axis=0)
+        norms = np.linalg.norm(npmi, axis=1) * np.linalg.norm(topic_vector)
+        cosines = np.divide(npmi @ topic_vector, norms, out=np.zeros(len(idx)), where=norms > 0)
+        c_v.append(cosines.mean())
+
+    if not c_v:
+        return {'c_v': 0.0, 'c_uci_doc': 0.0, 'c_npmi_doc': 0.0}
+
+    return {
+        'c_v': float(np.mean(c_v)),
+        'c_uci_doc': float(np.mean(c_uci)),
+        'c_npmi_doc': float(np.mean(c_npmi))
+    }
@@ -0,0 +1,337 @@
+"""
+c-TF-IDF Re-weighting Engine (No Model Refitting)
+
+Persists the topic x disease-code class-term count matrix of a fitted BERTopic
+model once, then recomputes c-TF-IDF weights under any ClassTfidfTransformer
+variant (reduce_frequent_words, bm25_weighting, top_n_words) directly from
+that matrix. The recomputation takes milliseconds, so representation sweeps
+no longer require re-running BERTopic fitting in the notebook.
+
+Output tables use the same [Word, c-TF-IDF, Topic] layout as the manuscript
+CTFIDF Excel files, so they can be passed straight to
+evaluate_from_excel.load_topics_from_excel().
+
+Requirements:
+    pip install pandas numpy openpyxl pyyaml
+    pip install bertopic  # only needed once, to build the count cache
+
+Usage:
+    python scripts/ctfidf_reweight.py
+"""
+
+import pickle
+import itertools
+import pandas as pd
+import numpy as np
+import yaml
+from pathlib import Path
+from typing import List, Dict, Sequence, Tuple
+import warnings
+warnings.filterwarnings('ignore')
+
+from cooccurrence_stats import SEP_TOKEN
+
+
+def load_data(data_path: str) -> pd.DataFrame:
+    """Load preprocessed data pickle file"""
+    print(f"Loading data from: {data_path}")
+    with open(data_path, 'rb') as f:
+        data = pickle.load(f)
+    return data
+
+
+def load_config(config_path: str) -> Dict:
+    """Load the BERTopic configuration (config/config.yaml)"""
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def prepare_documents(sequences: Sequence) -> List[str]:
+    """
+    Convert d2 disease sequences to BERTopic documents
+
+    Mirrors the notebook: codes are joined with spaces and 'SEP' is dropped.
+
+    Args:
+        sequences: Iterable of d2 lists (e.g. data['d2'])
+
+    Returns:
+        List of space-separated document strings
+    """
+    return [
+        ' '.join(str(code) for code in seq if code != SEP_TOKEN)
+        for seq in sequences
+    ]
+
+
+def build_class_term_counts(
+    documents: Sequence[str],
+    topics: Sequence[int]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Build the topic x term count matrix used by c-TF-IDF
+
+    Equivalent to BERTopic concatenating all documents of a topic and passing
+    them through CountVectorizer(tokenizer=str.split), but computed with a
+    single bincount over the flat token array.
+
+    Args:
+        documents: Space-separated documents, one per patient
+        topics: Topic assignment per document (topic_model.topics_)
+
+    Returns:
+        Tuple of (counts [n_topics x n_terms], topic_ids, vocabulary)
+    """
+    topics = np.asarray(topics, dtype=np.int64)
+    if len(documents) != len(topics):
+        raise ValueError(
+            f"Got {len(documents)} documents but {len(topics)} topic assignments"
+        )
+
+    tokenized = [doc.split() for doc in documents]
+    lengths = np.fromiter((len(t) for t in tokenized), dtype=np.int64, count=len(tokenized))
+    flat_tokens = np.array(list(itertools.chain.from_iterable(tokenized)), dtype=object)
+
+    vocabulary, term_idx = np.unique(flat_tokens.astype(str), return_inverse=True)
+    topic_ids, topic_idx = np.unique(topics, return_inverse=True)
+    token_topic_idx = np.repeat(topic_idx, lengths)
+
+    n_topics, n_terms = len(topic_ids), len(vocabulary)
+    counts = np.bincount(
+        token_topic_idx * n_terms + term_idx,
+        minlength=n_topics * n_terms
+    ).reshape(n_topics, n_terms)
+
+    return counts, topic_ids, vocabulary
+
+
+def save_class_term_counts(
+    output_path: str,
+    counts: np.ndarray,
+    topic_ids: np.ndarray,
+    vocabulary: np.ndarray
+) -> None:
+    """Persist a class-term count matrix as a compressed .npz file"""
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        output_path,
+        counts=counts,
+        topic_ids=topic_ids,
+        vocabulary=np.asarray(vocabulary, dtype=str)
+    )
+    print(f"Saved class-term counts to: {output_path}")
+
+
+def load_class_term_counts(input_path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Load a class-term count matrix saved by save_class_term_counts()"""
+    print(f"Loading class-term counts from: {input_path}")
+    with np.load(input_path) as cache:
+        return cache['counts'], cache['topic_ids'], cache['vocabulary']
+
+
+def compute_ctfidf(
+    counts: np.ndarray,
+    reduce_frequent_words: bool = True,
+    bm25_weighting: bool = False
+) -> np.ndarray:
+    """
+    Compute c-TF-IDF weights from a class-term count matrix
+
+    Follows BERTopic's ClassTfidfTransformer:
+        tf  = L1-normalised counts per topic (square-rooted if reduce_frequent_words)
+        idf = log(1 + A / f_t)                              (default)
+        idf = log(1 + (A - f_t + 0.5) / (f_t + 0.5))        (bm25_weighting)
+    where A is the average number of tokens per topic and f_t the total
+    frequency of term t across all topics.
+
+    Args:
+        counts: Topic x term count matrix
+        reduce_frequent_words: Apply square root to the term frequencies
+        bm25_weighting: Use the BM25-inspired idf instead of the default
+
+    Returns:
+        Topic x term c-TF-IDF matrix
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    df = counts.sum(axis=0)
+    avg_nr_samples = int(counts.sum(axis=1).mean())
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if bm25_weighting:
+            idf = np.log(1 + ((avg_nr_samples - df + 0.5) / (df + 0.5)))
+        else:
+            idf = np.log((avg_nr_samples / df) + 1)
+    idf = np.nan_to_num(idf, nan=0.0, posinf=0.0, neginf=0.0)
+
+    row_sums = counts.sum(axis=1, keepdims=True)
+    tf = np.divide(counts, row_sums, out=np.zeros_like(counts), where=row_sums > 0)
+    if reduce_frequent_words:
+        tf = np.sqrt(tf)
+
+    return tf * idf
+
+
+def ctfidf_table(
+    ctfidf: np.ndarray,
+    topic_ids: np.ndarray,
+    vocabulary: np.ndarray,
+    top_n_words: int = 10
+) -> pd.DataFrame:
+    """
+    Build a CTFIDF table in the manuscript [Word, c-TF-IDF, Topic] format
+
+    Args:
+        ctfidf: Topic x term c-TF-IDF matrix
+        topic_ids: Topic id for each row of the matrix
+        vocabulary: Term for each column of the matrix
+        top_n_words: Number of top words to keep per topic
+
+    Returns:
+        DataFrame sorted by topic, then by descending c-TF-IDF
+    """
+    top_n_words = min(top_n_words, ctfidf.shape[1])
+    # Stable descending sort so ties keep vocabulary order
+    order = np.argsort(-ctfidf, axis=1, kind='stable')[:, :top_n_words]
+    rows = np.arange(ctfidf.shape[0])[:, None]
+
+    words = pd.Series(np.asarray(vocabulary)[order].ravel())
+    # Disease codes are written as integers, matching the manuscript files
+    numeric = pd.to_numeric(words, errors='coerce')
+    if numeric.notna().all():
+        words = numeric.astype(np.int64)
+
+    return pd.DataFrame({
+        'Word': words.values,
+        'c-TF-IDF': ctfidf[rows, order].ravel(),
+        'Topic': np.repeat(np.asarray(topic_ids), top_n_words)
+    })
+
+
+def reweight(
+    counts: np.ndarray,
+    topic_ids: np.ndarray,
+    vocabulary: np.ndarray,
+    top_n_words: int = 10,
+    reduce_frequent_words: bool = True,
+    bm25_weighting: bool = False
+) -> pd.DataFrame:
+    """Recompute c-TF-IDF for one weighting variant and return its CTFIDF table"""
+    ctfidf = compute_ctfidf(
+        counts,
+        reduce_frequent_words=reduce_frequent_words,
+        bm25_weighting=bm25_weighting
+    )
+    return ctfidf_table(ctfidf, topic_ids, vocabulary, top_n_words=top_n_words)
+
+
+def load_topic_assignments(model_path: str, cache_path: str = None) -> np.ndarray:
+    """
+    Load per-document topic assignments (topics_) of a saved BERTopic model
+
+    The assignments are cached as .npy so later runs do not need to load the
+    model (or have bertopic installed) again.
+
+    Args:
+        model_path: Path to saved BERTopic model
+        cache_path: Optional .npy cache file for the assignments
+
+    Returns:
+        Topic id per document, in the order the model was fitted on
+    """
+    if cache_path is not None and Path(cache_path).exists():
+        print(f"Loading topic assignments from: {cache_path}")
+        return np.load(cache_path)
+
+    from bertopic import BERTopic
+
+    print(f"Loading model from: {model_path}")
+    topic_model = BERTopic.load(model_path)
+    topics = np.asarray(topic_model.topics_, dtype=np.int64)
+
+    if cache_path is not None:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        np.save(cache_path, topics)
+        print(f"Saved topic assignments to: {cache_path}")
+    return topics
+
+
+def variant_name(reduce_frequent_words: bool, bm25_weighting: bool) -> str:
+    """File-name suffix for a weighting variant"""
+    return f"rfw{int(reduce_frequent_words)}_bm25{int(bm25_weighting)}"
+
+
+def main():
+    """Build (or reuse) count caches and export CTFIDF tables for each variant"""
+
+    # Set paths relative to GIT directory
+    base_dir = Path(__file__).parent.parent
+
+    config = load_config(str(base_dir / "config" / "config.yaml"))
+    bertopic_cfg = config['bertopic']
+    top_n_words = bertopic_cfg['top_n_words']
+    ctfidf_cfg = bertopic_cfg['ctfidf']
+
+    models = {
+        'female': (2, base_dir / "1. Bertopic_over40" / config['models']['female_model']),
+        'male': (1, base_dir / "1. Bertopic_over40" / config['models']['male_model']),
+    }
+
+    data_path = base_dir / config['data']['data_file']
+
+    # Results directory
+    results_dir = base_dir / "results" / "ctfidf"
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    data = None
+
+    for name, (sex, model_path) in models.items():
+        print("\n" + "="*60)
+        print(f"Re-weighting {name.capitalize()} Model")
+        print("="*60 + "\n")
+
+        cache_path = results_dir / f"class_term_counts_{name}.npz"
+        assignments_path = results_dir / f"topic_assignments_{name}.npy"
+
+        if not cache_path.exists():
+            if not (model_path.exists() or assignments_path.exists()):
+                print(f"Warning: {name} model not found at {model_path}, skipping")
+                continue
+
+            if data is None:
+                data = load_data(str(data_path))
+                if not (isinstance(data, pd.DataFrame) and 'd2' in data.columns):
+                    raise ValueError("Expected DataFrame with 'd2' column")
+
+            docs = prepare_documents(data.loc[data['SEX'] == sex, 'd2'])
+            topics = load_topic_assignments(str(model_path), str(assignments_path))
+            counts, topic_ids, vocabulary = build_class_term_counts(docs, topics)
+            save_class_term_counts(str(cache_path), counts, topic_ids, vocabulary)
+        else:
+            counts, topic_ids, vocabulary = load_class_term_counts(str(cache_path))
+
+        print(f"Count matrix: {counts.shape[0]} topics x {counts.shape[1]} codes")
+
+        # Configured variant first, then the remaining combinations
+        variants = [(ctfidf_cfg['reduce_frequent_words'], ctfidf_cfg['bm25_weighting'])]
+        variants += [v for v in itertools.product([True, False], repeat=2) if v not in variants]
+
+        for reduce_frequent_words, bm25_weighting in variants:
+            table = reweight(
+                counts, topic_ids, vocabulary,
+                top_n_words=top_n_words,
+                reduce_frequent_words=reduce_frequent_words,
+                bm25_weighting=bm25_weighting
+            )
+            suffix = variant_name(reduce_frequent_words, bm25_weighting)
+            output = results_dir / f"{name}_CTFIDF_top{top_n_words}_{suffix}.xlsx"
+            table.to_excel(output, index=False)
+            print(f"  reduce_frequent_words={reduce_frequent_words}, "
+                  f"bm25_weighting={bm25_weighting} -> {output.name}")
+
+    print("\n" + "="*60)
+    print("Re-weighting Complete!")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
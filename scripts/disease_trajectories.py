@@ -0,0 +1,287 @@
+"""
+Disease Transition and Trajectory Mining (SEP-Delimited Visits)
+
+The d2 sequences encode yearly visit blocks separated by 'SEP', but topic
+modelling treats them as bags of codes. This script recovers the temporal
+order: for every patient it finds the first-onset time of each disease code
+and counts directed code -> code transitions (code A first seen before code B)
+into sparse 103 x 103 matrices per gender and per topic.
+
+Onset time is the AGE2 value of the code's visit block, so lags are in years;
+without AGE2 the visit-block index is used instead. Transitions can be
+restricted to a lag window (min_lag / max_lag, in years).
+
+All work is vectorised over the flat token array of a chunk of patients
+(no per-patient Python loops), and chunks can be processed in parallel with
+joblib, so the full 331,811-patient over-40 dataset fits in bounded memory.
+
+Requirements:
+    pip install pandas numpy scipy joblib pyyaml
+
+Usage:
+    python scripts/disease_trajectories.py
+"""
+
+import itertools
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+from scipy import sparse
+from joblib import Parallel, delayed
+import warnings
+warnings.filterwarnings('ignore')
+
+from ctfidf_reweight import load_config, load_data, load_topic_assignments
+from cooccurrence_stats import SEP_TOKEN, code_vocabulary
+
+
+def first_onsets(
+    sequences: Sequence[Sequence[str]],
+    vocabulary: np.ndarray,
+    ages: Optional[Sequence[Sequence]] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the first-onset time of every code for every patient
+
+    Args:
+        sequences: d2 lists, one per patient
+        vocabulary: Sorted array of disease codes
+        ages: Optional AGE2 lists aligned position-by-position with d2
+
+    Returns:
+        Tuple of (patient index, code index, onset time), sorted by patient
+        and then code, with one entry per (patient, code) pair
+    """
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    tokens = np.array(list(itertools.chain.from_iterable(sequences)), dtype=str)
+    patient = np.repeat(np.arange(len(sequences)), lengths)
+
+    is_sep = tokens == SEP_TOKEN
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    if ages is not None:
+        # AGE2 may lack the trailing SEP entry; positions beyond it are SEPs
+        age_lengths = np.fromiter((len(a) for a in ages), dtype=np.int64, count=len(ages))
+        flat_ages = np.array(list(itertools.chain.from_iterable(ages)), dtype=np.float64)
+        position = np.arange(len(tokens)) - starts[patient]
+        in_range = position < age_lengths[patient]
+        age_starts = np.concatenate(([0], np.cumsum(age_lengths)[:-1]))
+        time = np.full(len(tokens), np.nan)
+        time[in_range] = flat_ages[age_starts[patient[in_range]] + position[in_range]]
+    else:
+        # Visit block = number of SEP tokens before the token within its patient
+        seps = np.concatenate(([0], np.cumsum(is_sep)))
+        time = (seps[:-1] - seps[starts][patient]).astype(np.float64)
+
+    keep = ~is_sep & ~np.isnan(time)
+    tokens, patient, time = tokens[keep], patient[keep], time[keep]
+
+    code = np.searchsorted(vocabulary, tokens)
+    code = np.minimum(code, len(vocabulary) - 1)
+    known = vocabulary[code] == tokens
+    patient, code, time = patient[known], code[known], time[known]
+
+    # Earliest time per (patient, code): sort by key, then time
+    key = patient * len(vocabulary) + code
+    order = np.lexsort((time, key))
+    _, first = np.unique(key[order], return_index=True)
+    first = order[first]
+    return patient[first], code[first], time[first].astype(np.int64)
+
+
+def _chunk_transitions(
+    sequences: Sequence[Sequence[str]],
+    ages: Optional[Sequence[Sequence]],
+    groups: np.ndarray,
+    vocabulary: np.ndarray,
+    n_groups: int,
+    min_lag: int,
+    max_lag: Optional[int]
+) -> np.ndarray:
+    """Transition counts (n_groups x V x V) for one chunk of patients"""
+    n_codes = len(vocabulary)
+    counts = np.zeros(n_groups * n_codes * n_codes, dtype=np.int64)
+
+    patient, code, onset = first_onsets(sequences, vocabulary, ages)
+    if len(patient) == 0:
+        return counts.reshape(n_groups, n_codes, n_codes)
+
+    # Pair every onset with every onset of the same patient (m^2 per patient)
+    per_patient = np.bincount(patient, minlength=len(sequences))
+    patient_start = np.concatenate(([0], np.cumsum(per_patient)[:-1]))
+    m = per_patient[patient]
+    left = np.repeat(np.arange(len(patient)), m)
+    pair_start = np.concatenate(([0], np.cumsum(m)[:-1]))
+    right = np.repeat(patient_start[patient], m) + (np.arange(len(left)) - np.repeat(pair_start, m))
+
+    lag = onset[right] - onset[left]
+    valid = (left != right) & (lag >= max(min_lag, 0))
+    if max_lag is not None:
+        valid &= lag <= max_lag
+    left, right = left[valid], right[valid]
+
+    index = (groups[patient[left]] * n_codes + code[left]) * n_codes + code[right]
+    counts += np.bincount(index, minlength=len(counts))
+    return counts.reshape(n_groups, n_codes, n_codes)
+
+
+def transition_counts(
+    sequences: Sequence[Sequence[str]],
+    vocabulary: np.ndarray,
+    ages: Optional[Sequence[Sequence]] = None,
+    groups: Optional[Sequence[int]] = None,
+    min_lag: int = 1,
+    max_lag: Optional[int] = None,
+    chunk_size: int = 20000,
+    n_jobs: int = 1
+) -> np.ndarray:
+    """
+    Count first-onset code -> code transitions per patient group
+
+    A patient contributes one transition A -> B when the first onset of B
+    follows the first onset of A by min_lag..max_lag years (visit blocks when
+    ages is None). With min_lag=0, codes first seen in the same year are
+    counted in both directions.
+
+    Args:
+        sequences: d2 lists, one per patient
+        vocabulary: Sorted array of disease codes
+        ages: Optional AGE2 lists aligned with d2
+        groups: Group index (0..n_groups-1) per patient, e.g. encoded
+            gender x topic; all patients form one group if None
+        min_lag: Minimum onset lag for a transition
+        max_lag: Maximum onset lag for a transition (no limit if None)
+        chunk_size: Number of patients per chunk
+        n_jobs: Number of parallel joblib workers (-1 for all cores)
+
+    Returns:
+        Dense (n_groups x V x V) count array; see transition_matrices()
+    """
+    n_patients = len(sequences)
+    groups = np.zeros(n_patients, dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    if len(groups) != n_patients:
+        raise ValueError(f"Got {n_patients} sequences but {len(groups)} group labels")
+    n_groups = int(groups.max()) + 1 if n_patients else 1
+
+    bounds = [(s, min(s + chunk_size, n_patients)) for s in range(0, n_patients, chunk_size)]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_chunk_transitions)(
+            sequences[s:e],
+            None if ages is None else ages[s:e],
+            groups[s:e], vocabulary, n_groups, min_lag, max_lag
+        )
+        for s, e in bounds
+    )
+
+    n_codes = len(vocabulary)
+    total = np.zeros((n_groups, n_codes, n_codes), dtype=np.int64)
+    for chunk in results:
+        total += chunk
+    return total
+
+
+def transition_matrices(counts: np.ndarray) -> List[sparse.csr_matrix]:
+    """Split a (n_groups x V x V) count array into sparse V x V matrices"""
+    return [sparse.csr_matrix(group_counts) for group_counts in counts]
+
+
+def transitions_to_frame(
+    counts: np.ndarray,
+    vocabulary: np.ndarray,
+    group_labels: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Long-format table of the non-zero transitions
+
+    Args:
+        counts: (n_groups x V x V) count array
+        vocabulary: Disease code for each matrix row/column
+        group_labels: One row of label columns (e.g. SEX, Topic) per group
+
+    Returns:
+        DataFrame with the group label columns, from_code, to_code and count
+    """
+    g, a, b = np.nonzero(counts)
+    frame = group_labels.iloc[g].reset_index(drop=True)
+    frame['from_code'] = vocabulary[a]
+    frame['to_code'] = vocabulary[b]
+    frame['count'] = counts[g, a, b]
+    return frame
+
+
+def main():
+    """Mine transitions per gender and topic and export them as CSV"""
+
+    # Set paths relative to GIT directory
+    base_dir = Path(__file__).parent.parent
+
+    config = load_config(str(base_dir / "config" / "config.yaml"))
+    trajectories_cfg = config['trajectories']
+    data_path = base_dir / config['data']['data_file']
+    ctfidf_dir = base_dir / "results" / "ctfidf"
+
+    # Lag window in years (None = no upper limit)
+    min_lag = trajectories_cfg['min_lag']
+    max_lag = trajectories_cfg['max_lag']
+
+    # Results directory
+    results_dir = base_dir / "results" / "trajectories"
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    data = load_data(str(data_path))
+    if not (isinstance(data, pd.DataFrame) and 'd2' in data.columns):
+        raise ValueError("Expected DataFrame with 'd2' column")
+    print(f"Loaded {len(data)} patients")
+
+    # Topic of each patient within their gender's model (-1 if unavailable)
+    topics = np.full(len(data), -1, dtype=np.int64)
+    for name, sex in [('female', 2), ('male', 1)]:
+        model_path = base_dir / "1. Bertopic_over40" / config['models'][f'{name}_model']
+        cache_path = ctfidf_dir / f"topic_assignments_{name}.npy"
+        if not (model_path.exists() or cache_path.exists()):
+            print(f"Warning: {name} topic assignments not found, using Topic=-1")
+            continue
+        mask = (data['SEX'] == sex).values
+        assigned = load_topic_assignments(str(model_path), str(cache_path))
+        if len(assigned) != mask.sum():
+            raise ValueError(f"{name} model has {len(assigned)} assignments for {mask.sum()} patients")
+        topics[mask] = assigned
+
+    strata = pd.DataFrame({'SEX': data['SEX'].values, 'Topic': topics})
+    group_labels = strata.drop_duplicates().sort_values(['SEX', 'Topic']).reset_index(drop=True)
+    groups = strata.merge(
+        group_labels.reset_index(), on=['SEX', 'Topic'], how='left'
+    )['index'].values
+
+    sequences = data['d2'].tolist()
+    ages = data['AGE2'].tolist() if 'AGE2' in data.columns else None
+    vocabulary = code_vocabulary(sequences)
+    print(f"Disease codes: {len(vocabulary)}")
+
+    print(f"\nCounting transitions (lag {min_lag}..{max_lag if max_lag is not None else 'max'} years)...")
+    counts = transition_counts(
+        sequences, vocabulary, ages=ages, groups=groups,
+        min_lag=min_lag, max_lag=max_lag,
+        chunk_size=trajectories_cfg['chunk_size'],
+        n_jobs=trajectories_cfg['n_jobs']
+    )
+
+    topic_output = results_dir / "transitions_by_sex_topic.csv"
+    transitions_to_frame(counts, vocabulary, group_labels).to_csv(topic_output, index=False)
+    print(f"\nSaved to: {topic_output}")
+
+    # Per-gender matrices are the sum over that gender's topics
+    sexes = np.sort(group_labels['SEX'].unique())
+    sex_counts = np.stack([counts[(group_labels['SEX'] == sex).values].sum(axis=0) for sex in sexes])
+    sex_output = results_dir / "transitions_by_sex.csv"
+    transitions_to_frame(sex_counts, vocabulary, pd.DataFrame({'SEX': sexes})).to_csv(sex_output, index=False)
+    print(f"Saved to: {sex_output}")
+
+    print("\n" + "="*60)
+    print("Trajectory Mining Complete!")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
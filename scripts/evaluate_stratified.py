@@ -0,0 +1,279 @@
+"""
+Single-Pass Stratified Evaluation (Sex x Age Band x Region)
+
+evaluate_from_excel.py evaluates two hard-coded strata (SEX == 2 and
+SEX == 1) and rebuilds its dictionary and statistics for each. This script
+scans the corpus once: every document's codes are accumulated into one
+stratum-indexed array of document frequencies and co-document frequencies
+(n_strata x 103 x 103), together with per-stratum topic counts. Coherence and
+prevalence for every stratum, and for any coarser grouping (e.g. sex only),
+are then computed from that array without rescanning the documents.
+
+Strata are the cross of SEX, AGE_y bands and GAIBJA region as configured
+under evaluation.strata in config/config.yaml. Patients with a missing region
+or an age outside the bands form strata of their own (NaN label), so the
+sex x age band and sex roll-ups cover every document. Coherence is computed
+from document co-occurrence (see cooccurrence_stats.py), using each sex's
+manuscript CTFIDF topics; c_uci_doc / c_npmi_doc are not comparable with the
+c_uci / c_npmi columns of evaluate_from_excel.py.
+
+Requirements:
+    pip install pandas numpy scipy gensim openpyxl pyyaml
+
+Usage:
+    python scripts/evaluate_stratified.py
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Sequence, Tuple
+from scipy import sparse
+import warnings
+warnings.filterwarnings('ignore')
+
+from ctfidf_reweight import load_config, load_data, prepare_documents
+from cooccurrence_stats import (
+    build_incidence, coherence_from_cooccurrence, code_vocabulary, assign_strata
+)
+from evaluate_from_excel import load_topics_from_excel
+
+
+def stratified_cooccurrence(
+    incidence: sparse.csr_matrix,
+    strata: np.ndarray,
+    n_strata: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Accumulate per-stratum co-occurrence statistics in one pass
+
+    The incidence columns are offset by stratum (column s * V + t), so a single
+    sparse product X_offset.T @ X yields every stratum's V x V block at once.
+
+    Args:
+        incidence: Binary document x term matrix
+        strata: Stratum index per document (-1 rows are ignored)
+        n_strata: Number of strata
+
+    Returns:
+        Tuple of (doc_freq [S x V], co_doc_freq [S x V x V], n_docs [S])
+    """
+    incidence = sparse.csr_matrix(incidence, dtype=np.float64)
+    strata = np.asarray(strata, dtype=np.int64)
+    keep = strata >= 0
+    incidence, strata = incidence[keep], strata[keep]
+
+    n_terms = incidence.shape[1]
+    rows = np.repeat(np.arange(incidence.shape[0]), np.diff(incidence.indptr))
+    offset = sparse.csr_matrix(
+        (incidence.data, incidence.indices + strata[rows] * n_terms, incidence.indptr),
+        shape=(incidence.shape[0], n_strata * n_terms)
+    )
+
+    co_doc_freq = np.asarray((offset.T @ incidence).todense()).reshape(n_strata, n_terms, n_terms)
+    doc_freq = np.diagonal(co_doc_freq, axis1=1, axis2=2).copy()
+    n_docs = np.bincount(strata, minlength=n_strata)
+    return doc_freq, co_doc_freq, n_docs
+
+
+def stratified_topic_counts(
+    topics: np.ndarray,
+    strata: np.ndarray,
+    n_strata: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Count documents per (stratum, topic)
+
+    Args:
+        topics: Topic id per document
+        strata: Stratum index per document (-1 rows are ignored)
+        n_strata: Number of strata
+
+    Returns:
+        Tuple of (counts [S x n_topics], topic ids)
+    """
+    topics = np.asarray(topics, dtype=np.int64)
+    strata = np.asarray(strata, dtype=np.int64)
+    keep = strata >= 0
+    topic_ids, topic_idx = np.unique(topics[keep], return_inverse=True)
+    counts = np.bincount(
+        strata[keep] * len(topic_ids) + topic_idx,
+        minlength=n_strata * len(topic_ids)
+    ).reshape(n_strata, len(topic_ids))
+    return counts, topic_ids
+
+
+def aggregate_strata(
+    labels: pd.DataFrame,
+    by: Sequence[str],
+    *arrays: np.ndarray
+) -> Tuple[pd.DataFrame, List[np.ndarray]]:
+    """
+    Collapse fine strata to a coarser grouping by summing their statistics
+
+    Args:
+        labels: Stratum labels, one row per stratum
+        by: Label columns to keep (e.g. ['SEX'])
+        arrays: Stratum-indexed arrays (first axis = stratum) to sum
+
+    Returns:
+        Tuple of (coarse labels, list of summed arrays)
+    """
+    grouped = labels.groupby(list(by), observed=True, sort=True, dropna=False)
+    group = grouped.ngroup().to_numpy()
+    coarse = grouped.size().index.to_frame(index=False)
+    summed = []
+    for array in arrays:
+        out = np.zeros((len(coarse),) + array.shape[1:], dtype=array.dtype)
+        np.add.at(out, group, array)
+        summed.append(out)
+    return coarse, summed
+
+
+def evaluate_strata(
+    labels: pd.DataFrame,
+    topics_by_sex: Dict[int, List[List[str]]],
+    vocabulary: np.ndarray,
+    doc_freq: np.ndarray,
+    co_doc_freq: np.ndarray,
+    n_docs: np.ndarray,
+    sex_column: str = 'SEX'
+) -> pd.DataFrame:
+    """
+    Coherence for every stratum from the stratum-indexed statistics
+
+    Args:
+        labels: Stratum labels (must include the sex column)
+        topics_by_sex: Topic word lists for each SEX value
+        vocabulary: Terms indexing the statistics
+        doc_freq: Per-stratum document frequencies [S x V]
+        co_doc_freq: Per-stratum co-document frequencies [S x V x V]
+        n_docs: Documents per stratum [S]
+
+    Returns:
+        Stratum labels with n_documents, c_v, c_uci_doc and c_npmi_doc columns
+    """
+    results = []
+    for s, sex in enumerate(labels[sex_column]):
+        topics = topics_by_sex.get(sex, [])
+        coherence = coherence_from_cooccurrence(
+            topics, vocabulary, doc_freq[s], co_doc_freq[s], int(n_docs[s])
+        )
+        results.append({'n_documents': int(n_docs[s]), 'n_topics': len(topics), **coherence})
+    return pd.concat([labels.reset_index(drop=True), pd.DataFrame(results)], axis=1)
+
+
+def prevalence_table(
+    labels: pd.DataFrame,
+    counts: np.ndarray,
+    totals: np.ndarray,
+    column_ids: np.ndarray,
+    column_name: str
+) -> pd.DataFrame:
+    """Long-format prevalence (count / documents in stratum) per stratum"""
+    s, c = np.nonzero(counts)
+    table = labels.iloc[s].reset_index(drop=True)
+    table[column_name] = np.asarray(column_ids)[c]
+    table['count'] = counts[s, c]
+    table['prevalence'] = counts[s, c] / totals[s]
+    return table
+
+
+def main():
+    """Evaluate every stratum from a single pass over the corpus"""
+
+    # Set paths relative to GIT directory
+    base_dir = Path(__file__).parent.parent
+
+    config = load_config(str(base_dir / "config" / "config.yaml"))
+    strata_cfg = config['evaluation']['strata']
+    data_path = base_dir / config['data']['data_file']
+    ctfidf_dir = base_dir / "results" / "ctfidf"
+    shared_dir = base_dir / "1. Bertopic_over40" / "Shared_BERtopic_over40"
+    excel_files = {
+        2: ('female', shared_dir / "100pall_19y_over40_option1_female_dec20_CTFIDF_aug23.xlsx"),
+        1: ('male', shared_dir / "100pall_19y_over40_option1_male_dec20_CTFIDF_aug23.xlsx"),
+    }
+
+    # Results directory
+    results_dir = base_dir / "results" / "evaluation"
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    print("\n" + "="*60)
+    print("Loading data...")
+    print("="*60 + "\n")
+
+    data = load_data(str(data_path))
+    if not (isinstance(data, pd.DataFrame) and 'd2' in data.columns):
+        raise ValueError("Expected DataFrame with 'd2' column")
+    print(f"Loaded {len(data)} documents")
+
+    data = data.copy()
+    data['AgeBand'] = pd.cut(
+        data[strata_cfg['age_column']],
+        bins=strata_cfg['age_bins'],
+        labels=strata_cfg['age_labels'],
+        right=False
+    )
+    strata_columns = ['SEX', 'AgeBand', strata_cfg['region_column']]
+    strata, labels = assign_strata(data, strata_columns)
+    n_strata = len(labels)
+    print(f"Strata: {n_strata} ({' x '.join(strata_columns)})")
+
+    # Single pass over the corpus
+    print("Accumulating stratum-indexed co-occurrence statistics...")
+    vocabulary = code_vocabulary(data['d2'])
+    incidence = build_incidence(prepare_documents(data['d2']), vocabulary)
+    doc_freq, co_doc_freq, n_docs = stratified_cooccurrence(incidence, strata, n_strata)
+
+    topics_by_sex = {}
+    doc_topics = np.full(len(data), -1, dtype=np.int64)
+    has_assignments = False
+    for sex, (name, excel_path) in excel_files.items():
+        if excel_path.exists():
+            topics_by_sex[sex] = load_topics_from_excel(str(excel_path), top_n_words=10)
+        else:
+            print(f"Warning: {name} Excel file not found at {excel_path}")
+
+        assignments_path = ctfidf_dir / f"topic_assignments_{name}.npy"
+        mask = (data['SEX'] == sex).values
+        if assignments_path.exists():
+            assigned = np.load(assignments_path)
+            if len(assigned) == mask.sum():
+                doc_topics[mask] = assigned
+                has_assignments = True
+            else:
+                print(f"Warning: {assignments_path} does not match the {name} documents")
+
+    # Metrics for the full cross and for coarser groupings, all from one array
+    for level in [strata_columns, ['SEX', 'AgeBand'], ['SEX']]:
+        level_labels, (level_df, level_co, level_n) = aggregate_strata(
+            labels, level, doc_freq, co_doc_freq, n_docs
+        )
+        results = evaluate_strata(
+            level_labels, topics_by_sex, vocabulary, level_df, level_co, level_n
+        )
+        suffix = '_'.join(c.lower() for c in level)
+        output = results_dir / f"stratified_coherence_{suffix}.csv"
+        results.to_csv(output, index=False)
+        print(f"\nSaved to: {output}")
+        print(results.to_string(index=False))
+
+    # Prevalence of disease codes and topics per stratum
+    code_output = results_dir / "stratified_code_prevalence.csv"
+    prevalence_table(labels, doc_freq.astype(np.int64), n_docs, vocabulary, 'Code').to_csv(code_output, index=False)
+    print(f"\nSaved to: {code_output}")
+
+    if has_assignments:
+        topic_counts, topic_ids = stratified_topic_counts(doc_topics, strata, n_strata)
+        topic_output = results_dir / "stratified_topic_prevalence.csv"
+        prevalence_table(labels, topic_counts, n_docs, topic_ids, 'Topic').to_csv(topic_output, index=False)
+        print(f"Saved to: {topic_output}")
+
+    print("\n" + "="*60)
+    print("Stratified Evaluation Complete!")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Scalable UMAP/HDBSCAN Fitting (Fit on Subsample, Transform in Chunks)
+
+Fitting UMAP (n_neighbors=15, n_components=5) and HDBSCAN
+(min_cluster_size=150) on all ~177k female embeddings in one process
+dominates memory and will not scale to a multi-million-patient extract.
+This script fits the reducer and clusterer on a stratified subsample
+(proportional within age band x region strata), then projects and assigns the
+remaining patients in memory-bounded chunks with UMAP.transform() and
+hdbscan.approximate_predict() (requires prediction_data=True). Chunks are
+dispatched to a joblib thread pool, so all workers share the single
+in-process copy of the fitted models instead of receiving a pickled copy
+each. (A seeded UMAP forces its own n_jobs to 1, so the thread pool is the
+only source of parallelism in the assignment step.)
+
+HDBSCAN's min_cluster_size (and min_samples, if set) is an absolute count
+tuned for the full data, so it is scaled by the subsample's share of the
+rows; otherwise small subsamples would only find a few coarse clusters.
+
+For every configured subsample fraction it reports how far the resulting
+cluster assignments (adjusted Rand index, NMI) and topic coherence differ
+from a full fit on the same embeddings. The resulting labels can be turned
+into topic representations with ctfidf_reweight.build_class_term_counts().
+
+Embeddings are computed once with the configured sentence-transformers model
+and cached as a memory-mapped .npy file, so chunks are read lazily.
+
+Requirements:
+    pip install pandas numpy scipy umap-learn hdbscan scikit-learn joblib pyyaml
+    pip install sentence-transformers  # only needed once, to build the embedding cache
+
+Usage:
+    python scripts/scalable_fit.py
+"""
+
+import time
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from joblib import Parallel, delayed
+from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
+import warnings
+warnings.filterwarnings('ignore')
+
+from umap import UMAP
+import hdbscan
+
+from ctfidf_reweight import (
+    load_config, load_data, prepare_documents,
+    build_class_term_counts, compute_ctfidf, ctfidf_table
+)
+from cooccurrence_stats import (
+    build_incidence, cooccurrence_counts, coherence_from_cooccurrence,
+    code_vocabulary, topics_from_table, assign_strata
+)
+
+
+def compute_embeddings(
+    documents: list,
+    model_name: str,
+    output_path: str,
+    chunk_size: int = 20000
+) -> np.ndarray:
+    """
+    Embed documents chunk by chunk into a memory-mapped .npy cache
+
+    Args:
+        documents: Space-separated documents
+        model_name: sentence-transformers model (e.g. all-MiniLM-L6-v2)
+        output_path: .npy file to write
+        chunk_size: Number of documents encoded per chunk
+
+    Returns:
+        Read-only memory-mapped (n_documents x dim) embedding array
+    """
+    from sentence_transformers import SentenceTransformer
+
+    print(f"Embedding {len(documents)} documents with {model_name}...")
+    model = SentenceTransformer(model_name)
+    dim = model.get_sentence_embedding_dimension()
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    embeddings = np.lib.format.open_memmap(
+        output_path, mode='w+', dtype=np.float32, shape=(len(documents), dim)
+    )
+    for start in range(0, len(documents), chunk_size):
+        end = min(start + chunk_size, len(documents))
+        embeddings[start:end] = model.encode(documents[start:end], show_progress_bar=False)
+    embeddings.flush()
+    del embeddings
+
+    print(f"Saved embeddings to: {output_path}")
+    return np.load(output_path, mmap_mode='r')
+
+
+def stratified_subsample(
+    strata: np.ndarray,
+    fraction: float,
+    random_state: int = 42
+) -> np.ndarray:
+    """
+    Draw a proportional random subsample within every stratum
+
+    Each stratum contributes ceil(fraction * size) rows, so small strata are
+    always represented.
+
+    Args:
+        strata: Stratum index per row (-1 rows form their own stratum)
+        fraction: Share of rows to draw, in (0, 1]
+        random_state: Seed for the draw
+
+    Returns:
+        Sorted row indices of the subsample
+    """
+    strata = np.asarray(strata, dtype=np.int64) + 1
+    if fraction >= 1:
+        return np.arange(len(strata))
+
+    rng = np.random.default_rng(random_state)
+    perm = rng.permutation(len(strata))
+    order = perm[np.argsort(strata[perm], kind='stable')]
+
+    sizes = np.bincount(strata)
+    take = np.ceil(fraction * sizes).astype(np.int64)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    rank = np.arange(len(order)) - starts[strata[order]]
+    return np.sort(order[rank < take[strata[order]]])
+
+
+def scale_hdbscan_params(hdbscan_params: Dict, fraction: float) -> Dict:
+    """
+    Scale HDBSCAN's size thresholds to a subsample
+
+    Args:
+        hdbscan_params: HDBSCAN keyword arguments tuned on the full data
+        fraction: Share of the rows being clustered
+
+    Returns:
+        Copy of hdbscan_params with min_cluster_size (and min_samples, if set)
+        multiplied by fraction, but at least 2
+    """
+    scaled = dict(hdbscan_params)
+    for key in ['min_cluster_size', 'min_samples']:
+        if scaled.get(key) is not None:
+            scaled[key] = max(2, int(round(scaled[key] * fraction)))
+    return scaled
+
+
+def _assign_chunk(
+    reducer: UMAP,
+    clusterer: hdbscan.HDBSCAN,
+    embeddings: np.ndarray
+) -> np.ndarray:
+    """Project one chunk with UMAP and assign it to the fitted clusters"""
+    reduced = reducer.transform(np.asarray(embeddings))
+    labels, _ = hdbscan.approximate_predict(clusterer, reduced)
+    return labels
+
+
+def fit_subsample_transform(
+    embeddings: np.ndarray,
+    fit_index: np.ndarray,
+    umap_params: Dict,
+    hdbscan_params: Dict,
+    chunk_size: int = 20000,
+    n_jobs: int = 1
+) -> Tuple[np.ndarray, UMAP, hdbscan.HDBSCAN]:
+    """
+    Fit UMAP/HDBSCAN on a subsample and assign every other row in chunks
+
+    Rows in the subsample keep the clusterer's own labels; the rest are
+    assigned with approximate_predict, chunk_size rows at a time. Chunks run
+    on n_jobs threads that share the fitted models, so peak memory is one
+    copy of the models plus n_jobs chunks.
+
+    Args:
+        embeddings: (n_documents x dim) embeddings, may be memory-mapped
+        fit_index: Row indices to fit on
+        umap_params: UMAP keyword arguments (config bertopic.umap)
+        hdbscan_params: HDBSCAN keyword arguments (config bertopic.hdbscan)
+        chunk_size: Rows projected per chunk
+        n_jobs: Threads assigning chunks in parallel (-1 for all cores)
+
+    Returns:
+        Tuple of (cluster label per row, fitted reducer, fitted clusterer)
+    """
+    hdbscan_params = {**hdbscan_params, 'prediction_data': True}
+
+    reducer = UMAP(**umap_params)
+    reduced = reducer.fit_transform(np.asarray(embeddings[fit_index]))
+    clusterer = hdbscan.HDBSCAN(**hdbscan_params).fit(reduced)
+
+    labels = np.full(len(embeddings), -1, dtype=np.int64)
+    labels[fit_index] = clusterer.labels_
+
+    rest = np.setdiff1d(np.arange(len(embeddings)), fit_index, assume_unique=True)
+    chunks = [rest[s:s + chunk_size] for s in range(0, len(rest), chunk_size)]
+    # Threads, not processes: every chunk reuses the same reducer and clusterer
+    results = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(_assign_chunk)(reducer, clusterer, embeddings[chunk])
+        for chunk in chunks
+    )
+    for chunk, chunk_labels in zip(chunks, results):
+        labels[chunk] = chunk_labels
+
+    return labels, reducer, clusterer
+
+
+def assignment_coherence(
+    documents: list,
+    labels: np.ndarray,
+    cooccurrence: Tuple[np.ndarray, np.ndarray, int, np.ndarray],
+    top_n_words: int = 10,
+    reduce_frequent_words: bool = True,
+    bm25_weighting: bool = False
+) -> Dict[str, float]:
+    """Coherence of the c-TF-IDF topics implied by a cluster assignment"""
+    doc_freq, co_doc_freq, n_docs, vocabulary = cooccurrence
+    counts, topic_ids, counts_vocab = build_class_term_counts(documents, labels)
+    table = ctfidf_table(
+        compute_ctfidf(counts, reduce_frequent_words, bm25_weighting),
+        topic_ids, counts_vocab, top_n_words=top_n_words
+    )
+    return coherence_from_cooccurrence(
+        topics_from_table(table), vocabulary, doc_freq, co_doc_freq, n_docs
+    )
+
+
+def compare_to_reference(
+    labels: np.ndarray,
+    reference: Optional[np.ndarray]
+) -> Dict[str, float]:
+    """Agreement of a cluster assignment with the full-fit assignment"""
+    result = {
+        'n_clusters': int(len(np.unique(labels[labels != -1]))),
+        'outlier_ratio': float(np.mean(labels == -1)),
+    }
+    if reference is not None:
+        result['ari_vs_full'] = adjusted_rand_score(reference, labels)
+        result['nmi_vs_full'] = normalized_mutual_info_score(reference, labels)
+    return result
+
+
+def main():
+    """Compare subsample fits against a full fit for each gender"""
+
+    # Set paths relative to GIT directory
+    base_dir = Path(__file__).parent.parent
+
+    config = load_config(str(base_dir / "config" / "config.yaml"))
+    bertopic_cfg = config['bertopic']
+    fit_cfg = config['scalable_fit']
+    strata_cfg = config['evaluation']['strata']
+    data_path = base_dir / config['data']['data_file']
+    embeddings_dir = base_dir / "results" / "embeddings"
+
+    # Results directory
+    results_dir = base_dir / "results" / "evaluation"
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    data = load_data(str(data_path))
+    if not (isinstance(data, pd.DataFrame) and 'd2' in data.columns):
+        raise ValueError("Expected DataFrame with 'd2' column")
+
+    for name, sex in [('female', 2), ('male', 1)]:
+        print("\n" + "="*60)
+        print(f"Scalable Fit: {name.capitalize()} Model")
+        print("="*60 + "\n")
+
+        subset = data[data['SEX'] == sex].copy()
+        documents = prepare_documents(subset['d2'])
+        print(f"{name.capitalize()} documents: {len(documents)}")
+
+        embeddings_path = embeddings_dir / f"embeddings_{name}.npy"
+        if embeddings_path.exists():
+            print(f"Loading embeddings from: {embeddings_path}")
+            embeddings = np.load(embeddings_path, mmap_mode='r')
+        else:
+            embeddings = compute_embeddings(
+                documents, bertopic_cfg['embedding_model'],
+                str(embeddings_path), chunk_size=fit_cfg['chunk_size']
+            )
+        if len(embeddings) != len(documents):
+            raise ValueError(f"{embeddings_path} has {len(embeddings)} rows for {len(documents)} documents")
+
+        # Subsample strata: age band x region within this gender
+        subset['AgeBand'] = pd.cut(
+            subset[strata_cfg['age_column']],
+            bins=strata_cfg['age_bins'],
+            labels=strata_cfg['age_labels'],
+            right=False
+        )
+        strata, _ = assign_strata(subset, ['AgeBand', strata_cfg['region_column']])
+
+        # Co-occurrence statistics shared by all coherence evaluations
+        vocabulary = code_vocabulary(subset['d2'])
+        doc_freq, co_doc_freq, n_docs = cooccurrence_counts(build_incidence(documents, vocabulary))
+        cooccurrence = (doc_freq, co_doc_freq, n_docs, vocabulary)
+
+        fractions = sorted(set(fit_cfg['subsample_fractions']))
+        if fit_cfg.get('compare_full_fit', True):
+            fractions = [1.0] + [f for f in fractions if f < 1]
+
+        reference, reference_coherence = None, None
+        rows = []
+        for fraction in fractions:
+            fit_index = stratified_subsample(strata, fraction, fit_cfg['random_state'])
+            hdbscan_params = bertopic_cfg['hdbscan']
+            if fit_cfg.get('scale_min_cluster_size', True):
+                hdbscan_params = scale_hdbscan_params(hdbscan_params, len(fit_index) / len(embeddings))
+            print(f"\nFraction {fraction:.2f}: fitting on {len(fit_index)} patients "
+                  f"(min_cluster_size={hdbscan_params['min_cluster_size']})...")
+
+            start = time.perf_counter()
+            labels, _, _ = fit_subsample_transform(
+                embeddings, fit_index,
+                bertopic_cfg['umap'], hdbscan_params,
+                chunk_size=fit_cfg['chunk_size'], n_jobs=fit_cfg['n_jobs']
+            )
+            seconds = time.perf_counter() - start
+
+            coherence = assignment_coherence(
+                documents, labels, cooccurrence,
+                top_n_words=bertopic_cfg['top_n_words'],
+                reduce_frequent_words=bertopic_cfg['ctfidf']['reduce_frequent_words'],
+                bm25_weighting=bertopic_cfg['ctfidf']['bm25_weighting']
+            )
+            if fraction >= 1:
+                reference, reference_coherence = labels, coherence
+
+            row = {
+                'fraction': fraction,
+                'n_fit': len(fit_index),
+                'min_cluster_size': hdbscan_params['min_cluster_size'],
+                'seconds': seconds,
+                **compare_to_reference(labels, reference),
+                **coherence
+            }
+            if reference_coherence is not None:
+                for metric in ['c_v', 'c_uci_doc', 'c_npmi_doc']:
+                    row[f'delta_{metric}'] = coherence[metric] - reference_coherence[metric]
+            rows.append(row)
+
+            print(f"  Clusters: {row['n_clusters']}, outliers: {row['outlier_ratio']:.3f}, "
+                  f"C_v: {coherence['c_v']:.4f}, time: {seconds:.1f}s")
+            if 'ari_vs_full' in row:
+                print(f"  ARI vs full: {row['ari_vs_full']:.4f}, NMI vs full: {row['nmi_vs_full']:.4f}")
+
+        output = results_dir / f"scalable_fit_{name}.csv"
+        pd.DataFrame(rows).to_csv(output, index=False)
+        print(f"\nSaved to: {output}")
+
+    print("\n" + "="*60)
+    print("Scalable Fit Comparison Complete!")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Topic-Count Reduction Sweep (Single Fitted Clustering)
+
+Explores topic counts other than the nr_topics="auto" result (19 female /
+20 male) without refitting UMAP and HDBSCAN. Starting from one fitted model's
+topic x code count matrix (cached by ctfidf_reweight.py), topics are merged
+hierarchically along a single precomputed linkage over their c-TF-IDF
+vectors (cosine distance, average linkage, as in BERTopic's reduce_topics).
+Every k in the range is cut from that one linkage; merged topics are
+re-weighted by summing their counts and recomputing c-TF-IDF.
+
+Coherence for each k is scored from cached document co-occurrence
+statistics (see cooccurrence_stats.py) and diversity from the merged top
+words, giving a k-vs-metric curve in one pass.
+
+Requirements:
+    pip install pandas numpy scipy gensim openpyxl pyyaml
+
+Usage:
+    python scripts/ctfidf_reweight.py   # once, to build the count caches
+    python scripts/topic_reduction_sweep.py
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+from scipy.cluster import hierarchy
+from scipy.spatial.distance import pdist
+import warnings
+warnings.filterwarnings('ignore')
+
+from ctfidf_reweight import (
+    load_config, load_data, prepare_documents,
+    load_class_term_counts, compute_ctfidf, ctfidf_table
+)
+from cooccurrence_stats import (
+    build_incidence, cooccurrence_counts, save_cooccurrence,
+    load_cooccurrence, coherence_from_cooccurrence, topics_from_table
+)
+from evaluate_from_excel import calculate_diversity_metrics
+
+
+def topic_linkage(
+    counts: np.ndarray,
+    topic_ids: np.ndarray,
+    reduce_frequent_words: bool = True,
+    bm25_weighting: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Precompute the topic-similarity linkage used for all reductions
+
+    The outlier topic (-1) is kept out of the linkage and never merged.
+
+    Args:
+        counts: Topic x term count matrix
+        topic_ids: Topic id for each row of counts
+        reduce_frequent_words: c-TF-IDF setting used for the topic vectors
+        bm25_weighting: c-TF-IDF setting used for the topic vectors
+
+    Returns:
+        Tuple of (linkage matrix, ids of the topics in the linkage)
+    """
+    ctfidf = compute_ctfidf(counts, reduce_frequent_words, bm25_weighting)
+    valid = topic_ids != -1
+    distances = pdist(ctfidf[valid], metric='cosine')
+    return hierarchy.linkage(distances, method='average'), topic_ids[valid]
+
+
+def merge_counts(
+    counts: np.ndarray,
+    topic_ids: np.ndarray,
+    labels: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, Dict[int, int]]:
+    """
+    Merge topic rows of the count matrix according to cluster labels
+
+    Args:
+        counts: Topic x term count matrix (including the outlier row, if any)
+        topic_ids: Topic id for each row of counts
+        labels: Cluster label (0..k-1) for each non-outlier topic, in order
+
+    Returns:
+        Tuple of (merged counts, merged topic ids, original -> merged id mapping)
+    """
+    valid = topic_ids != -1
+    merged_ids = np.full(len(topic_ids), -1, dtype=np.int64)
+
+    # Number merged topics by their lowest original id (BERTopic ids follow topic size)
+    order = pd.unique(labels[np.argsort(topic_ids[valid], kind='stable')])
+    relabel = np.empty(len(order), dtype=np.int64)
+    relabel[order] = np.arange(len(order))
+    merged_ids[valid] = relabel[labels]
+
+    new_ids = np.unique(merged_ids)
+    row_idx = np.searchsorted(new_ids, merged_ids)
+    merged = np.zeros((len(new_ids), counts.shape[1]), dtype=counts.dtype)
+    np.add.at(merged, row_idx, counts)
+
+    mapping = {int(t): int(m) for t, m in zip(topic_ids, merged_ids)}
+    return merged, new_ids, mapping
+
+
+def reduction_sweep(
+    counts: np.ndarray,
+    topic_ids: np.ndarray,
+    vocabulary: np.ndarray,
+    doc_freq: np.ndarray,
+    co_doc_freq: np.ndarray,
+    n_docs: int,
+    k_values: Sequence[int],
+    top_n_words: int = 10,
+    reduce_frequent_words: bool = True,
+    bm25_weighting: bool = False
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Reduce one fitted model to every k and score each reduction
+
+    Args:
+        counts: Topic x term count matrix of the fitted model
+        topic_ids: Topic id for each row of counts
+        vocabulary: Term for each column of counts
+        doc_freq: Cached document frequencies (same vocabulary order)
+        co_doc_freq: Cached co-document frequencies (same vocabulary order)
+        n_docs: Number of documents behind the co-occurrence statistics
+        k_values: Topic counts to evaluate (excluding the outlier topic)
+        top_n_words: Number of top words per topic
+        reduce_frequent_words: c-TF-IDF setting
+        bm25_weighting: c-TF-IDF setting
+
+    Returns:
+        Tuple of (k-vs-metric curve, original -> merged topic mapping per k)
+    """
+    linkage, linked_ids = topic_linkage(counts, topic_ids, reduce_frequent_words, bm25_weighting)
+    n_topics = len(linked_ids)
+    k_values = sorted(k for k in set(k_values) if 1 <= k <= n_topics)
+    if not k_values:
+        raise ValueError(f"No k in range: the model has {n_topics} non-outlier topics")
+
+    # Cut the single linkage at every k at once. cut_tree is queried in
+    # descending k because it mislabels k == n_topics in ascending requests.
+    cuts = hierarchy.cut_tree(linkage, n_clusters=k_values[::-1])[:, ::-1]
+
+    curve, mappings = [], []
+    for col, k in enumerate(k_values):
+        merged, merged_ids, mapping = merge_counts(counts, topic_ids, cuts[:, col])
+        table = ctfidf_table(
+            compute_ctfidf(merged, reduce_frequent_words, bm25_weighting),
+            merged_ids, vocabulary, top_n_words=top_n_words
+        )
+        topics = topics_from_table(table)
+
+        coherence = coherence_from_cooccurrence(topics, vocabulary, doc_freq, co_doc_freq, n_docs)
+        diversity = calculate_diversity_metrics(topics)
+        curve.append({'k': k, **coherence, **diversity})
+        mappings.append(pd.Series(mapping, name=k))
+
+        print(f"  k={k:>3}: C_v={coherence['c_v']:.4f}  C_npmi_doc={coherence['c_npmi_doc']:.4f}  "
+              f"Jaccard={diversity['avg_jaccard_distance']:.4f}")
+
+    mapping_df = pd.concat(mappings, axis=1)
+    mapping_df.index.name = 'Topic'
+    return pd.DataFrame(curve), mapping_df
+
+
+def main():
+    """Run the reduction sweep for the female and male models"""
+
+    # Set paths relative to GIT directory
+    base_dir = Path(__file__).parent.parent
+
+    config = load_config(str(base_dir / "config" / "config.yaml"))
+    bertopic_cfg = config['bertopic']
+    ctfidf_cfg = bertopic_cfg['ctfidf']
+
+    data_path = base_dir / config['data']['data_file']
+    ctfidf_dir = base_dir / "results" / "ctfidf"
+
+    # Results directory
+    results_dir = base_dir / "results" / "evaluation"
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    data = None
+
+    for name, sex in [('female', 2), ('male', 1)]:
+        print("\n" + "="*60)
+        print(f"Reduction Sweep: {name.capitalize()} Model")
+        print("="*60 + "\n")
+
+        counts_path = ctfidf_dir / f"class_term_counts_{name}.npz"
+        if not counts_path.exists():
+            print(f"Warning: {counts_path} not found - run ctfidf_reweight.py first")
+            continue
+        counts, topic_ids, vocabulary = load_class_term_counts(str(counts_path))
+
+        cooc_path = ctfidf_dir / f"cooccurrence_{name}.npz"
+        if cooc_path.exists():
+            doc_freq, co_doc_freq, n_docs, cooc_vocab = load_cooccurrence(str(cooc_path))
+        else:
+            if data is None:
+                data = load_data(str(data_path))
+            docs = prepare_documents(data.loc[data['SEX'] == sex, 'd2'])
+            cooc_vocab = vocabulary
+            doc_freq, co_doc_freq, n_docs = cooccurrence_counts(build_incidence(docs, vocabulary))
+            save_cooccurrence(str(cooc_path), doc_freq, co_doc_freq, n_docs, vocabulary)
+
+        if not np.array_equal(cooc_vocab, vocabulary):
+            raise ValueError(f"Vocabulary of {cooc_path} does not match {counts_path}")
+
+        n_topics = int((topic_ids != -1).sum())
+        curve, mapping = reduction_sweep(
+            counts, topic_ids, vocabulary, doc_freq, co_doc_freq, n_docs,
+            k_values=range(2, n_topics + 1),
+            top_n_words=bertopic_cfg['top_n_words'],
+            reduce_frequent_words=ctfidf_cfg['reduce_frequent_words'],
+            bm25_weighting=ctfidf_cfg['bm25_weighting']
+        )
+
+        curve_output = results_dir / f"topic_reduction_sweep_{name}.csv"
+        curve.to_csv(curve_output, index=False)
+        mapping_output = results_dir / f"topic_reduction_mapping_{name}.csv"
+        mapping.to_csv(mapping_output)
+        print(f"\nSaved to: {curve_output}")
+        print(f"Saved to: {mapping_output}")
+
+    print("\n" + "="*60)
+    print("Reduction Sweep Complete!")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()